@@ -63,18 +63,117 @@
 
 
 import argparse
+import hashlib
+import heapq
 import os
 import re
 import sys
+import threading
 import time
 from array import array
+from collections import OrderedDict
 from datetime import datetime
 
+try:
+    from types import MappingProxyType
+except ImportError:  # python 2
+    class MappingProxyType(dict):
+        """Read-only dict, standing in for types.MappingProxyType of python 3."""
+        def _read_only(self, *args, **kwargs):
+            raise TypeError("'MappingProxyType' object does not support item assignment")
+        __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
 
 __version = "0.13"
 
 
-class SimpleTextAndIcons:
+class LruCache:
+    """A cache of at most size values, dropping the least recently used first. It can be shared by threads."""
+    def __init__(self, size=1024):
+        self.size = size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, create):
+        """Returns the value cached for key. If there is none, it is created by create(key) and cached."""
+        with self._lock:
+            if key in self._values:
+                value = self._values.pop(key)
+                self._values[key] = value
+                return value
+        value = create(key)
+        with self._lock:
+            self._values[key] = value
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+        return value
+
+
+    def __len__(self):
+        return len(self._values)
+
+
+class ImageContext:
+    """The images preloaded or loaded (":file.png:") while rendering texts, to be referenced by number (":1:").
+        A context is meant to be used by one thread at a time, see FrozenTextAndIcons.
+    """
+    def __init__(self):
+        self.bitmap_preloaded = [([], 0)]
+        self.bitmaps_preloaded_unused = False
+        self.bitmap_files = {}
+
+    def add_preload_img(self, filename):
+        """Still used by main, but deprecated. PLease use ":"-notation for bitmap() / bitmap_text()"""
+        self.bitmap_preloaded.append(SimpleTextAndIcons.bitmap_img(filename))
+        self.bitmaps_preloaded_unused = True
+
+
+    def are_preloaded_unused(self):
+        """Still used by main, but deprecated. PLease use ":"-notation for bitmap() / bitmap_text()"""
+        return self.bitmaps_preloaded_unused == True
+
+
+    def load_img(self, filename):
+        """Loads an image referenced in a text by its file name.
+            On the first load of a file, it is added to the preloaded images, so it can be referenced by number
+            afterwards. Further references to the same file reuse that image and its number, also in other texts.
+            If the file has been modified since, it is read again and keeps its number.
+        """
+        mtime = os.path.getmtime(filename)
+        if filename in self.bitmap_files:
+            (bitmap, number, loaded) = self.bitmap_files[filename]
+            if loaded == mtime:
+                return bitmap
+            bitmap = SimpleTextAndIcons.bitmap_img(filename)
+            self.bitmap_preloaded[number] = bitmap
+        else:
+            bitmap = SimpleTextAndIcons.bitmap_img(filename)
+            number = len(self.bitmap_preloaded)
+            self.bitmap_preloaded.append(bitmap)
+        self.bitmap_files[filename] = (bitmap, number, mtime)
+        return bitmap
+
+
+    @staticmethod
+    def _check_number(number, count):
+        if number >= count:
+            raise IndexError(":%d: references no image, only %d are loaded. Each image file gets a number only once, "
+                             "when it is used first." % (number, count - 1))
+
+
+    def preloaded(self, number):
+        ImageContext._check_number(number, len(self.bitmap_preloaded))
+        self.bitmaps_preloaded_unused = False
+        return self.bitmap_preloaded[number]
+
+
+class SimpleTextAndIcons(ImageContext):
     font_11x44 = (
         # 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
         0x00, 0x38, 0x6c, 0xc6, 0xc6, 0xfe, 0xc6, 0xc6, 0xc6, 0xc6, 0x00,
@@ -291,23 +390,13 @@ class SimpleTextAndIcons:
     }
 
     bitmap_builtin = {}
+    builtin_names = {}
     for i in bitmap_named:
         bitmap_builtin[bitmap_named[i][2]] = bitmap_named[i]
+        builtin_names[bitmap_named[i][2]] = i
 
-
-    def __init__(self):
-        self.bitmap_preloaded = [([], 0)]
-        self.bitmaps_preloaded_unused = False
-
-    def add_preload_img(self, filename):
-        """Still used by main, but deprecated. PLease use ":"-notation for bitmap() / bitmap_text()"""
-        self.bitmap_preloaded.append(SimpleTextAndIcons.bitmap_img(filename))
-        self.bitmaps_preloaded_unused = True
-
-
-    def are_preloaded_unused(self):
-        """Still used by main, but deprecated. PLease use ":"-notation for bitmap() / bitmap_text()"""
-        return self.bitmaps_preloaded_unused == True
+    _markup = re.compile(r':([^:]*):')
+    _parse_cache = LruCache(1024)
 
 
     @staticmethod
@@ -324,44 +413,107 @@ class SimpleTextAndIcons:
             if ch in SimpleTextAndIcons.bitmap_builtin:
                 return SimpleTextAndIcons.bitmap_builtin[ch][:2]
 
-            self.bitmaps_preloaded_unused = False
-            return self.bitmap_preloaded[ord(ch)]
+            return self.preloaded(ord(ch))
 
         o = SimpleTextAndIcons.char_offsets[ch]
         return (SimpleTextAndIcons.font_11x44[o:o + 11], 1)
 
 
-    def bitmap_text(self, text):
-        """Returns a tuple of (buffer, length_in_byte_columns_aka_chars)
-          We preprocess the text string for substitution patterns
-          "::" is replaced with a single ":"
-          ":1: is replaced with CTRL-A referencing the first preloaded or loaded image.
-          ":happy:" is replaced with a reference to a builtin smiley glyph
-          ":heart:" is replaced with a reference to a builtin heart glyph
-          ":gfx/logo.png:" preloads the file gfx/logo.png and is replaced the corresponding control char.
+    @staticmethod
+    def parse_text(text):
+        """Returns the parse tree of a text in ":"-notation as a tuple of (kind, value) tuples:
+          ('text', string) is a run of characters of the font,
+          ('icon', name) is a builtin icon from bitmap_named, given as ":name:" or by its control character,
+          ('image', filename) is an image file given as ":filename:", it has to contain a '.',
+          ('ref', number) references a preloaded or loaded image, given as ":1:", ":2:", ... or a control character.
+          "::" is a ':' in a text run.
+          Parse trees are cached, so parsing the same text again costs just a lookup.
         """
+        return SimpleTextAndIcons._parse_cache.get(text, lambda t: SimpleTextAndIcons._tokenize(
+            t, SimpleTextAndIcons.bitmap_named, SimpleTextAndIcons.builtin_names))
+
 
-        def replace_symbolic(m):
+    @staticmethod
+    def _tokenize(text, named, builtin_names):
+        """Parses text into a tree as described in parse_text(), with the given icons by name and control character."""
+        tokens = []
+        run = []
+
+        def end_run():
+            if run:
+                tokens.append(('text', ''.join(run)))
+                del run[:]
+
+        def add_chars(chars):
+            for c in chars:
+                if ord(c) >= 32:
+                    run.append(c)
+                    continue
+                end_run()
+                if c in builtin_names:
+                    tokens.append(('icon', builtin_names[c]))
+                else:
+                    tokens.append(('ref', ord(c)))
+
+        pos = 0
+        for m in SimpleTextAndIcons._markup.finditer(text):
+            add_chars(text[pos:m.start()])
+            pos = m.end()
             name = m.group(1)
             if name == '':
-                return ':'
+                run.append(':')
+                continue
+            end_run()
             if re.match('^[0-9]*$', name):  # py3 name.isdecimal()
-                return chr(int(name))
-            if '.' in name:
-                self.bitmap_preloaded.append(SimpleTextAndIcons.bitmap_img(name))
-                return chr(len(self.bitmap_preloaded) - 1)
-            return SimpleTextAndIcons.bitmap_named[name][2]
+                tokens.append(('ref', int(name)))
+            elif '.' in name:
+                tokens.append(('image', name))
+            elif name in named:
+                tokens.append(('icon', name))
+            else:
+                raise KeyError("Unknown icon :%s: -- See -l for a list of builtins" % name)
+        add_chars(text[pos:])
+        end_run()
+        return tuple(tokens)
 
-        text = re.sub(r':([^:]*):', replace_symbolic, text)
+
+    @staticmethod
+    def _render_text(tree, context, named, font, offsets):
         buf = array('B')
         cols = 0
-        for c in text:
-            (b, n) = self.bitmap_char(c)
+        for (kind, value) in tree:
+            if kind == 'text':
+                for c in value:
+                    o = offsets[c]
+                    buf.extend(font[o:o + 11])
+                cols += len(value)
+                continue
+            if kind == 'icon':
+                (b, n) = named[value][:2]
+            elif kind == 'image':
+                (b, n) = context.load_img(value)
+            else:
+                (b, n) = context.preloaded(value)
             buf.extend(b)
             cols += n
         return (buf, cols)
 
 
+    def bitmap_text(self, text):
+        """Returns a tuple of (buffer, length_in_byte_columns_aka_chars)
+          The text is parsed for substitution patterns, see parse_text():
+          "::" is replaced with a single ":"
+          ":1: references the first preloaded or loaded image.
+          ":happy:" is replaced with a reference to a builtin smiley glyph
+          ":heart:" is replaced with a reference to a builtin heart glyph
+          ":gfx/logo.png:" loads the file gfx/logo.png and inserts it. The first time a file is used, it gets the next
+          number, so it can be referenced by number afterwards. Using it again reuses it and keeps its number.
+        """
+        return SimpleTextAndIcons._render_text(SimpleTextAndIcons.parse_text(text), self,
+                                               SimpleTextAndIcons.bitmap_named, SimpleTextAndIcons.font_11x44,
+                                               SimpleTextAndIcons.char_offsets)
+
+
     @staticmethod
     def bitmap_img(file):
         """Returns a tuple of (buffer, length_in_byte_columns) representing the given image file.
@@ -399,6 +551,90 @@ class SimpleTextAndIcons:
         return (buf, cols)
 
 
+    @staticmethod
+    def bitmap_img_length(file):
+        """Returns the length in byte columns bitmap_img(file) will have. Only the image size is read for that."""
+        from PIL import Image
+
+        im = Image.open(file)
+        if im.height != 11:
+            sys.exit("%s: image height must be 11px. Seen %d" % (file, im.height))
+        cols = int((im.width + 7) / 8)
+        im.close()
+        return cols
+
+
+    @staticmethod
+    def _length_state(context):
+        """Returns the widths of the images preloaded and loaded in the context, as needed by _text_length()."""
+        preloaded = [b[1] for b in context.bitmap_preloaded]
+        files = {}
+        for f in context.bitmap_files:
+            (bitmap, number, mtime) = context.bitmap_files[f]
+            if mtime == os.path.getmtime(f):
+                files[f] = bitmap[1]
+            else:  # load_img() will read it again
+                files[f] = SimpleTextAndIcons.bitmap_img_length(f)
+                preloaded[number] = files[f]
+        return (preloaded, files)
+
+
+    @staticmethod
+    def _text_length(tree, named, state):
+        """state is a tuple of (widths of the preloaded images, widths of loaded files by name) from _length_state().
+            Images loaded by the text are added, so it can be carried from one text to the next.
+        """
+        (preloaded, files) = state
+        cols = 0
+        for (kind, value) in tree:
+            if kind == 'text':
+                cols += len(value)
+            elif kind == 'icon':
+                cols += named[value][1]
+            elif kind == 'image':
+                if value not in files:
+                    files[value] = SimpleTextAndIcons.bitmap_img_length(value)
+                    preloaded.append(files[value])
+                cols += files[value]
+            else:
+                ImageContext._check_number(value, len(preloaded))
+                cols += preloaded[value]
+        return cols
+
+
+    @staticmethod
+    def _lengths(args, parse, named, state):
+        lengths = []
+        for arg in args:
+            if os.path.exists(arg):
+                lengths.append(SimpleTextAndIcons.bitmap_img_length(arg))
+            else:
+                lengths.append(SimpleTextAndIcons._text_length(parse(arg), named, state))
+        return lengths
+
+
+    def bitmap_text_length(self, text):
+        """Returns the length in byte columns bitmap_text(text) will have, without rendering or loading any images."""
+        return SimpleTextAndIcons._text_length(SimpleTextAndIcons.parse_text(text),
+                                               SimpleTextAndIcons.bitmap_named, SimpleTextAndIcons._length_state(self))
+
+
+    def bitmap_length(self, arg):
+        """Returns the length in byte columns bitmap(arg) will have. This is cheap, compared to bitmap() itself,
+            and allows to create the header before rendering, see LedNameBadge.write_pipelined().
+        """
+        return self.bitmap_lengths((arg,))[0]
+
+
+    def bitmap_lengths(self, args):
+        """Returns the lengths in byte columns bitmap() will return for each of the args, when called for one after
+            the other. Unlike calling bitmap_length() for each, images loaded by one arg can be referenced by number in
+            the following ones.
+        """
+        return SimpleTextAndIcons._lengths(args, SimpleTextAndIcons.parse_text,
+                                           SimpleTextAndIcons.bitmap_named, SimpleTextAndIcons._length_state(self))
+
+
     def bitmap(self, arg):
         """If arg is a valid and existing path name, we load it as an image.
             Otherwise, we take it as a string (with ":"-notation, see bitmap_text()).
@@ -408,6 +644,81 @@ class SimpleTextAndIcons:
         return self.bitmap_text(arg)
 
 
+class FrozenTextAndIcons(object):
+    """An immutable variant of SimpleTextAndIcons, which can be shared by many threads, e.g. of a web server.
+        It takes a read-only snapshot of the font and the named icons on creation and uses only that, also for
+        parsing, so later changes to SimpleTextAndIcons do not affect it. Besides that, it only keeps its own
+        thread safe cache of parse trees. Preloaded and loaded images are kept in an ImageContext given to each call,
+        or a fresh one per call if none is given.
+    """
+    __slots__ = ('font', 'char_offsets', 'bitmap_named', 'builtin_names', '_parse_cache')
+
+    def __init__(self):
+        object.__setattr__(self, 'font', tuple(SimpleTextAndIcons.font_11x44))
+        object.__setattr__(self, 'char_offsets', MappingProxyType(dict(SimpleTextAndIcons.char_offsets)))
+        named = {}
+        builtin_names = {}
+        for name in SimpleTextAndIcons.bitmap_named:
+            (b, n, ch) = SimpleTextAndIcons.bitmap_named[name]
+            named[name] = (tuple(b), n, ch)
+            builtin_names[ch] = name
+        object.__setattr__(self, 'bitmap_named', MappingProxyType(named))
+        object.__setattr__(self, 'builtin_names', MappingProxyType(builtin_names))
+        object.__setattr__(self, '_parse_cache', LruCache(1024))
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenTextAndIcons is immutable")
+
+
+    def __delattr__(self, name):
+        raise AttributeError("FrozenTextAndIcons is immutable")
+
+
+    def parse_text(self, text):
+        """Like SimpleTextAndIcons.parse_text(), with the icons of this renderer."""
+        return self._parse_cache.get(text, lambda t: SimpleTextAndIcons._tokenize(t, self.bitmap_named,
+                                                                                  self.builtin_names))
+
+
+    def bitmap_text(self, text, context=None):
+        """Like SimpleTextAndIcons.bitmap_text(), images are loaded to and referenced in the given context."""
+        return SimpleTextAndIcons._render_text(self.parse_text(text), context or ImageContext(), self.bitmap_named,
+                                               self.font, self.char_offsets)
+
+
+    def bitmap_length(self, arg, context=None):
+        """Like SimpleTextAndIcons.bitmap_length(). The context is not changed."""
+        return self.bitmap_lengths((arg,), context)[0]
+
+
+    def bitmap_lengths(self, args, context=None):
+        """Like SimpleTextAndIcons.bitmap_lengths(). The context is not changed."""
+        return SimpleTextAndIcons._lengths(args, self.parse_text, self.bitmap_named,
+                                           SimpleTextAndIcons._length_state(context or ImageContext()))
+
+
+    def bitmap(self, arg, context=None):
+        """Like SimpleTextAndIcons.bitmap(), images are loaded to and referenced in the given context."""
+        if os.path.exists(arg):
+            return SimpleTextAndIcons.bitmap_img(arg)
+        return self.bitmap_text(arg, context)
+
+
+class DeviceError(IOError):
+    """Raised by LedNameBadge.write(), if the device is not found or cannot be set up."""
+
+
+class WriteError(DeviceError):
+    """Raised by LedNameBadge.write(), if a report could not be written to the device.
+        report is the index of the first report not written, stats holds (attempts, seconds) of the reports written.
+    """
+    def __init__(self, report, stats, message):
+        IOError.__init__(self, message)
+        self.report = report
+        self.stats = stats
+
+
 class LedNameBadge:
     _protocol_header_template = (
         0x77, 0x61, 0x6e, 0x67, 0x00, 0x00, 0x00, 0x00, 0x40, 0x40, 0x40, 0x40, 0x40, 0x40, 0x40, 0x40,
@@ -473,7 +784,8 @@ or
             * blinks and ants: 0..1 or even False..True,
             * brightness, if given, is any number, but it'll be limited to 25, 50, 75, 100 (percent), here
             * date, if given, is a datetime object. It will be written in the header, but is not to be seen on the
-              devices screen.
+              devices screen. None leaves these bytes zero, so the same content always gives the same header, e.g. for
+              payloads to be exported or stored.
         """
         try:
             lengths_sum = sum(lengths)
@@ -511,6 +823,9 @@ or
             h[17 + (2 * i) - 1] = lengths[i] // 256
             h[17 + (2 * i)] = lengths[i] % 256
 
+        if date is None:
+            return h
+
         try:
             h[38 + 0] = date.year % 100
             h[38 + 1] = date.month
@@ -525,61 +840,475 @@ or
 
 
     @staticmethod
-    def write(buf):
-        """Write the given buffer to the device.
-            It has to begin with a protocol header as provided by header() and followed by the bitmap data.
-            In short: the bitmap data is organized in bytes with 8 horizontal pixels per byte and 11 resp. 12
-            bytes per (8 pixels wide) byte-column. Then just put one byte-column after the other and one bitmap
-            after the other.
+    def _pad(buf):
+        """Returns a copy of buf, padded with zeros to a multiple of 64 bytes, the size of a report.
+            Raises ValueError, if it is more than the 8192 bytes the device can take.
         """
+        buf = array('B', buf)
         need_padding = len(buf) % 64
         if need_padding:
             buf.extend((0,) * (64 - need_padding))
 
         if len(buf) > 8192:
-            print("Writing more than 8192 bytes damages the display!")
-            sys.exit(1)
+            raise ValueError("Writing more than 8192 bytes damages the display! Payload has %d bytes." % len(buf))
+        return buf
+
+
+    @staticmethod
+    def export(buf, filename):
+        """Save the given buffer to a .badge file instead of writing it to the device.
+            A copy of the buffer is padded just like write() does, so the file contains exactly the bytes sent to the
+            device.
+            Use load() and write() to send it later, without rendering anything again.
+        """
+        buf = LedNameBadge._pad(buf)
+        with open(filename, 'wb') as f:
+            f.write(buf.tostring() if sys.version_info[0] < 3 else buf.tobytes())
+
+
+    @staticmethod
+    def load(filename):
+        """Load a .badge file as written by export(). Returns the buffer ready for write()."""
+        buf = array('B')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if sys.version_info[0] < 3:
+            buf.fromstring(data)
+        else:
+            buf.frombytes(data)
+        if not buf or len(buf) % 64 or len(buf) > 8192 or \
+                tuple(buf[:4]) != LedNameBadge._protocol_header_template[:4]:
+            raise ValueError("%s: not a valid .badge file" % filename)
+        return buf
+
+
+    @staticmethod
+    def _write_reports(buf, sendbuf, send, start=0, retries=3, backoff=0.05, delay=0):
+        """Send buf in 64 byte reports, beginning with report number start.
+            Each report is framed into the reused sendbuf (the payload goes to its last 64 bytes, so a leading report
+            ID byte is kept) without copying slices of buf. send(sendbuf) has to return the number of bytes written.
+            A failed or short write is retried up to retries times, waiting backoff, 2*backoff, 4*backoff, ... seconds.
+            delay is slept before every report.
+            Returns a list of (attempts, seconds) tuples, one for each report sent. Raises WriteError, if a report
+            could not be written, its index is in WriteError.report, so you can continue from there.
+        """
+        try:
+            view = memoryview(buf)
+            payload = memoryview(sendbuf)[len(sendbuf) - 64:]
+        except TypeError:  # python 2 arrays do not support memoryview, slices are copied there
+            view = None
+        stats = []
+        try:
+            for i in range(start, len(buf) // 64):
+                if view is None:
+                    sendbuf[len(sendbuf) - 64:] = buf[i * 64:i * 64 + 64]
+                else:
+                    payload[:] = view[i * 64:i * 64 + 64]
+                t = time.time()
+                attempt = 0
+                while True:
+                    attempt += 1
+                    if delay:
+                        time.sleep(delay)
+                    try:
+                        written = send(sendbuf)
+                        error = None
+                    except Exception as e:
+                        written = -1
+                        error = e
+                    if written == len(sendbuf):
+                        break
+                    if attempt > retries:
+                        raise WriteError(i, stats, "Writing report %d failed after %d attempts: %s" % (
+                            i, attempt, error if error else "%s of %d bytes written" % (written, len(sendbuf))))
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                stats.append((attempt, time.time() - t))
+        finally:
+            # The caller may extend buf afterwards, which is not possible as long as a view on it exists.
+            if view is not None:
+                payload.release()
+                view.release()
+        return stats
+
+
+    @staticmethod
+    def _hid_id(dev_info):
+        path = dev_info.path
+        return path if isinstance(path, str) else path.decode()
+
+
+    @staticmethod
+    def _usb_id(dev):
+        return "%d:%d" % (dev.bus, dev.address)
+
+
+    @staticmethod
+    def _usb_find(**kwargs):
+        try:
+            return LedNameBadge.usb.core.find(idVendor=0x0416, idProduct=0x5020, **kwargs)
+        except Exception as e:
+            # e.g. usb.core.NoBackendError, if libusb is missing
+            raise DeviceError("Cannot search for USB devices: %s" % e)
+
 
+    @staticmethod
+    def devices():
+        """Returns the ids of all connected devices, to select one of them for write() and write_pipelined().
+            With pyhidapi, this is the HID path of the device, with pyusb it is "bus:address".
+        """
         if LedNameBadge._have_pyhidapi:
-            dev_info = LedNameBadge.pyhidapi.hid_enumerate(0x0416, 0x5020)
+            return [LedNameBadge._hid_id(d) for d in LedNameBadge.pyhidapi.hid_enumerate(0x0416, 0x5020)]
+        return [LedNameBadge._usb_id(d) for d in LedNameBadge._usb_find(find_all=True)]
+
+
+    @staticmethod
+    def _open(device=None):
+        """Opens the device with the given id (see devices()) or the first one found, if device is None.
+            Returns a tuple (sendbuf, send, delay, close), where sendbuf, send and delay are to be given to
+            _write_reports() and close() has to be called when done. Raises DeviceError, if this is not possible.
+        """
+        not_found = "No led tag with vendorID 0x0416 and productID 0x5020 found%s.\n" \
+                    "Connect the led tag and run this tool as root." % ("" if device is None else " as " + device)
+        if LedNameBadge._have_pyhidapi:
+            dev_info = [d for d in LedNameBadge.pyhidapi.hid_enumerate(0x0416, 0x5020)
+                        if device is None or LedNameBadge._hid_id(d) == device]
             # dev = pyhidapi.hid_open(0x0416, 0x5020)
-            if dev_info:
-                dev = LedNameBadge.pyhidapi.hid_open_path(dev_info[0].path)
-                print("using [%s %s] int=%d page=%s via pyHIDAPI" % (
-                    dev_info[0].manufacturer_string, dev_info[0].product_string, dev_info[0].interface_number, dev_info[0].usage_page))
-            else:
-                print("No led tag with vendorID 0x0416 and productID 0x5020 found.")
-                print("Connect the led tag and run this tool as root.")
-                sys.exit(1)
-            for i in range(int(len(buf)/64)):
-                # sendbuf must contain "report ID" as first byte. "0" does the job here.
-                sendbuf=array('B',[0])
-                # Then, put the 64 payload bytes into the buffer
-                sendbuf.extend(buf[i*64:i*64+64])
-                LedNameBadge.pyhidapi.hid_write(dev, sendbuf)
-            LedNameBadge.pyhidapi.hid_close(dev)
+            if not dev_info:
+                raise DeviceError(not_found)
+            dev = LedNameBadge.pyhidapi.hid_open_path(dev_info[0].path)
+            if not dev:
+                raise DeviceError("Cannot open %s. Run this tool as root." % LedNameBadge._hid_id(dev_info[0]))
+            print("using [%s %s] int=%d page=%s via pyHIDAPI" % (
+                dev_info[0].manufacturer_string, dev_info[0].product_string, dev_info[0].interface_number, dev_info[0].usage_page))
+            # sendbuf must contain "report ID" as first byte. "0" does the job here.
+            # The 64 payload bytes follow.
+            return (array('B', (0,) * 65), lambda b: LedNameBadge.pyhidapi.hid_write(dev, b), 0,
+                    lambda: LedNameBadge.pyhidapi.hid_close(dev))
         else:
-            dev = LedNameBadge.usb.core.find(idVendor=0x0416, idProduct=0x5020)
+            if device is None:
+                dev = LedNameBadge._usb_find()
+            else:
+                dev = LedNameBadge._usb_find(custom_match=lambda d: LedNameBadge._usb_id(d) == device)
             if dev is None:
-                print("No led tag with vendorID 0x0416 and productID 0x5020 found.")
-                print("Connect the led tag and run this tool as root.")
-                sys.exit(1)
+                raise DeviceError(not_found)
             try:
                 # win32: NotImplementedError: is_kernel_driver_active
                 if dev.is_kernel_driver_active(0):
                     dev.detach_kernel_driver(0)
             except:
                 pass
-            dev.set_configuration()
+            try:
+                dev.set_configuration()
+            except Exception as e:
+                raise DeviceError("Cannot configure %s: %s" % (LedNameBadge._usb_id(dev), e))
             print("using [%s %s] bus=%d dev=%d" % (dev.manufacturer, dev.product, dev.bus, dev.address))
-            for i in range(int(len(buf) / 64)):
-                time.sleep(0.1)
-                dev.write(1, buf[i * 64:i * 64 + 64])
+            return (array('B', (0,) * 64), lambda b: dev.write(1, b), 0.1, lambda: None)
+
+
+    @staticmethod
+    def write(buf, start=0, retries=3, backoff=0.05, device=None):
+        """Write the given buffer to the device.
+            It has to begin with a protocol header as provided by header() and followed by the bitmap data.
+            In short: the bitmap data is organized in bytes with 8 horizontal pixels per byte and 11 resp. 12
+            bytes per (8 pixels wide) byte-column. Then just put one byte-column after the other and one bitmap
+            after the other.
+            Every 64 byte report is checked and retried (see _write_reports() for retries and backoff). If this does
+            not help, WriteError is raised. Call write() again with start=WriteError.report to resume at the failed
+            report instead of uploading everything again. More than 8192 bytes raise ValueError.
+            device is the id of the device to write to (see devices()), None for the first one found. DeviceError is
+            raised, if it is not found.
+            Returns a list of (attempts, seconds) tuples, one for each report written.
+        """
+        buf = LedNameBadge._pad(buf)
+
+        (sendbuf, send, delay, close) = LedNameBadge._open(device)
+        try:
+            return LedNameBadge._write_reports(buf, sendbuf, send, start, retries, backoff, delay)
+        finally:
+            close()
+
+
+    @staticmethod
+    def write_pipelined(header, bitmaps, queue_size=2, retries=3, backoff=0.05, device=None, lines=11):
+        """Like write(), but the bitmap data comes from the iterable bitmaps, e.g. a generator rendering one message
+            after the other. It is consumed by a separate thread, while the header and each bitmap are sent as soon
+            as they are available. So rendering and transferring overlap. At most queue_size rendered bitmaps wait
+            for transfer.
+            As the header comes first, the lengths of all bitmaps have to be known in advance, see
+            SimpleTextAndIcons.bitmap_length().
+            lines is the number of bytes per byte-column, 11 or 12 (for 12x48 devices). With the lengths from the
+            header, it gives the total size, which is checked before anything is sent: if it is more than 8192 bytes,
+            ValueError is raised.
+            Returns a list of (attempts, seconds) tuples, one for each report written. An exception raised while
+            rendering is raised here, too.
+        """
+        columns = 0
+        for i in range(8):
+            columns += header[16 + 2 * i] * 256 + header[17 + 2 * i]
+        size = len(header) + columns * lines
+        if (size + 63) // 64 * 64 > 8192:
+            raise ValueError("Writing more than 8192 bytes damages the display! Payload has %d bytes." % size)
+
+        bitmaps_queue = queue.Queue(queue_size)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for bitmap in bitmaps:
+                    while not stop.is_set():
+                        try:
+                            bitmaps_queue.put((bitmap, None), timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = (None, None)
+            except BaseException as e:
+                # also SystemExit, e.g. from bitmap_img(), otherwise the consumer waits forever
+                item = (None, e)
+            while not stop.is_set():
+                try:
+                    bitmaps_queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+        (sendbuf, send, delay, close) = LedNameBadge._open(device)
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        buf = array('B', header)
+        try:
+            stats = LedNameBadge._write_reports(buf, sendbuf, send, 0, retries, backoff, delay)
+            while True:
+                (bitmap, error) = bitmaps_queue.get()
+                if error:
+                    raise error
+                if bitmap is None:
+                    break
+                buf.extend(bitmap)
+                if len(buf) > 8192:
+                    raise ValueError("Writing more than 8192 bytes damages the display!")
+                stats += LedNameBadge._write_reports(buf, sendbuf, send, len(stats), retries, backoff, delay)
+            buf = LedNameBadge._pad(buf)
+            stats += LedNameBadge._write_reports(buf, sendbuf, send, len(stats), retries, backoff, delay)
+            return stats
+        finally:
+            stop.set()
+            close()
+
+
+class PayloadStore:
+    """A directory of ready-to-send payloads, each stored as a .badge file named by the sha256 hash of its content.
+        Payloads can be rendered on one host, and copied around and sent from others via LedNameBadge.write().
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+
+    @staticmethod
+    def key(buf):
+        """Returns the key of the given (padded) buffer, the hex digest of its sha256 hash."""
+        return hashlib.sha256(bytearray(buf)).hexdigest()
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.badge')
+
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+
+    def put(self, buf):
+        """Adds a copy of the given buffer (padded like LedNameBadge.write() does) to the store and returns its key.
+            Storing an existing payload again does nothing.
+        """
+        buf = LedNameBadge._pad(buf)
+        key = PayloadStore.key(buf)
+        if key not in self:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            tmp = "%s.%d.tmp" % (self.path(key), os.getpid())
+            LedNameBadge.export(buf, tmp)
+            os.rename(tmp, self.path(key))
+        return key
+
+
+    def get(self, key):
+        """Returns the buffer stored under the given key. Raises KeyError, if there is none, and ValueError, if the
+            stored payload is damaged and does not match its key anymore.
+        """
+        if key not in self:
+            raise KeyError(key)
+        buf = LedNameBadge.load(self.path(key))
+        if PayloadStore.key(buf) != key:
+            raise ValueError("%s: content does not match its key" % self.path(key))
+        return buf
+
+
+class PlaylistEntry:
+    """A pre-rendered payload for PlaylistScheduler. It is shown from start until end (seconds since the epoch as of
+        time.time(), None for no limit) on the given badges (names as given to PlaylistScheduler, None for all).
+    """
+    def __init__(self, payload, start=None, end=None, priority=0, badges=None):
+        self.payload = LedNameBadge._pad(payload)
+        self.start = start
+        self.end = end
+        self.priority = priority
+        self.badges = badges
+
+
+    def active(self, badge, t):
+        return (self.start is None or self.start <= t) and (self.end is None or t < self.end) and \
+            (self.badges is None or badge in self.badges)
+
+
+class SimulatedClock:
+    """Replaces the time module for PlaylistScheduler, e.g. in tests: sleep() returns at once and advances time()."""
+    def __init__(self, now=0):
+        self.now = now
+
+
+    def time(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class PlaylistScheduler:
+    """Rotates a playlist of more content than fits on a badge through one or more badges.
+        Time is divided in slots of slot seconds. At the beginning of each slot, and when the time window of an entry
+        starts or ends, every badge gets the payload of the active entry with the highest priority. Active entries of the same priority take turns slot by slot. If no
+        entry is active, e.g. because its time window has ended, the default payload is shown, an empty display if
+        none is given. A payload is only written, if it differs from the one already shown on that badge.
+        badges maps names to device ids (see LedNameBadge.devices()) or to functions writing a payload. The default is
+        {'badge': None}, the first device found.
+        clock is anything with time() and sleep() like the time module (the default) or a SimulatedClock.
+    """
+    def __init__(self, badges=None, slot=60, clock=time, default=None):
+        self.badges = badges or {'badge': None}
+        self.slot = slot
+        self.clock = clock
+        if default is None:
+            default = array('B', LedNameBadge.header((1,), (4,), (4,), (0,), (0,)))
+            default.extend((0,) * 12)
+        self.default = PlaylistEntry(default)
+        self.entries = []
+        self.shown = {}
+        self.events = []
+        self._seq = 0
+
+
+    def add(self, payload, start=None, end=None, priority=0, badges=None):
+        """Adds a payload (e.g. from header() and bitmaps, LedNameBadge.load() or PayloadStore.get()) to the playlist.
+            It is padded here once, so nothing has to be done for it later on. Returns the PlaylistEntry.
+        """
+        entry = PlaylistEntry(payload, start, end, priority, badges)
+        self.entries.append(entry)
+        return entry
+
+
+    def remove(self, entry):
+        self.entries.remove(entry)
+
+
+    def select(self, badge, t):
+        """Returns the entry to be shown on the badge at the time t, default if none is active."""
+        candidates = [e for e in self.entries if e.active(badge, t)]
+        if not candidates:
+            return self.default
+        priority = max(e.priority for e in candidates)
+        candidates = [e for e in candidates if e.priority == priority]
+        return candidates[int(t // self.slot) % len(candidates)]
+
+
+    def _push(self, t, badge, slot=True):
+        self._seq += 1
+        heapq.heappush(self.events, (t, self._seq, badge, slot))
+
+
+    def _pending(self, t):
+        for e in self.entries:
+            if e.end is None or e.end > t:
+                return True
+        return False
+
+
+    def update(self, badge, t):
+        """Writes the entry selected for the time t to the badge, if it is not shown there already."""
+        entry = self.select(badge, t)
+        if self.shown.get(badge) is entry:
+            return
+        write = self.badges[badge]
+        try:
+            if callable(write):
+                write(entry.payload)
+            else:
+                LedNameBadge.write(entry.payload, device=write)
+            self.shown[badge] = entry
+        except Exception as e:
+            # e.g. DeviceError, if the badge is unplugged. Try again in the next slot.
+            print("%s: %s" % (badge, e))
+            self.shown.pop(badge, None)
+
+
+    def run(self, until=None):
+        """Updates all badges now, at every slot boundary and whenever the time window of an entry starts or ends,
+            sleeping in between. Entries added while running take effect at the next slot boundary.
+            Returns at until (as of clock.time()), or when no entry is left to be shown in the future. The badges
+            get the default payload before.
+        """
+        now = self.clock.time()
+        self.events = []
+        for badge in sorted(self.badges):
+            self._push(now, badge)
+            for e in self.entries:
+                if e.badges is None or badge in e.badges:
+                    for t in (e.start, e.end):
+                        if t is not None and t > now:
+                            self._push(t, badge, False)
+        while self.events:
+            (t, seq, badge, slot) = heapq.heappop(self.events)
+            if until is not None and t >= until:
+                break
+            wait = t - self.clock.time()
+            if wait > 0:
+                self.clock.sleep(wait)
+            self.update(badge, t)
+            # Only the slot events of a badge are followed by the next one, the start and end events are extra.
+            if slot and (self._pending(t) or self.shown.get(badge) is not self.select(badge, t)):
+                self._push((t // self.slot + 1) * self.slot, badge)
 
 
 def split_to_ints(list_str):
     return [int(x) for x in re.split(r'[\s,]+', list_str)]
 
+def patch_12x48(msg_bitmap):
+    # trivial hack to support 12x48 badges:
+    # patch extra empty lines into the message stream.
+    for i in reversed(range(1, int(len(msg_bitmap[0]) / 11) + 1)):
+        msg_bitmap[0][i * 11:i * 11] = array('B', [0])
+
+def warn_preloaded_unused(creator):
+    if creator.are_preloaded_unused():
+        print(
+            "\nWARNING:\n Your preloaded images are not used.\n Try without '-p' or embed the control character '^A' in your message.\n")
+
+def write_or_exit(write, *args, **kwargs):
+    try:
+        write(*args, **kwargs)
+    except WriteError as e:
+        sys.exit("%s\nThe upload is incomplete. Please reconnect the device and try again." % e)
+    except DeviceError as e:
+        sys.exit(str(e))
+    except ValueError as e:
+        sys.exit(str(e))
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      description='Upload messages or graphics to a 11x44 led badge via USB HID.\nVersion %s from https://github.com/jnweiger/led-badge-ls32\n -- see there for more examples and for updates.' % __version,
@@ -598,7 +1327,18 @@ def main():
                         help=argparse.SUPPRESS)  # "Load bitmap images. Use ^A, ^B, ^C, ... in text messages to make them visible. Deprecated, embed within ':' instead")
     parser.add_argument('-l', '--list-names', action='version', help="list named icons to be embedded in messages and exit",
                         version=':' + ':  :'.join(SimpleTextAndIcons._get_named_bitmaps_keys()) + ':  ::  or e.g. :path/to/some_icon.png:')
-    parser.add_argument('message', metavar='MESSAGE', nargs='+',
+    parser.add_argument('-D', '--device', metavar='ID',
+                        help="Upload to the device with this id, if more than one is connected. See --list-devices")
+    parser.add_argument('--list-devices', action='store_true', help="List the ids of all connected devices and exit")
+    parser.add_argument('-P', '--pipeline', action='store_true',
+                        help="Upload each message as soon as it is rendered, overlapping rendering and USB transfer")
+    parser.add_argument('-e', '--export', metavar='FILE',
+                        help="Write the payload to FILE (e.g. out.badge) instead of uploading it to the device")
+    parser.add_argument('-S', '--send', metavar='FILE',
+                        help="Upload the payload from FILE, a .badge file written with --export. With --store, FILE may also be a key of the store. No MESSAGE is needed.")
+    parser.add_argument('--store', metavar='DIR',
+                        help="Content addressed store of payloads. Adds the payload to DIR and prints its key instead of uploading it. See --send.")
+    parser.add_argument('message', metavar='MESSAGE', nargs='*',
                         help="Up to 8 message texts with embedded builtin icons or loaded images within colons(:) -- See -l for a list of builtins")
     parser.add_argument('--mode-help', action='version', help=argparse.SUPPRESS, version="""
     
@@ -623,48 +1363,109 @@ def main():
     """ % sys.argv[0])
     args = parser.parse_args()
 
+    if not LedNameBadge._have_pyhidapi:
+        if args.hid != "0":
+            sys.exit("HID API access is needed but not initialized. Fix your setup")
+
+    if args.list_devices:
+        try:
+            for device in LedNameBadge.devices():
+                print(device)
+        except DeviceError as e:
+            sys.exit(str(e))
+        return
+
+    if args.send:
+        try:
+            if args.store and not os.path.exists(args.send):
+                buf = PayloadStore(args.store).get(args.send)
+            else:
+                buf = LedNameBadge.load(args.send)
+        except KeyError:
+            sys.exit("%s: no such payload in %s" % (args.send, args.store))
+        except (IOError, ValueError) as e:
+            sys.exit(str(e))
+        write_or_exit(LedNameBadge.write, buf, device=args.device)
+        return
+
+    if not args.message:
+        parser.error("at least one MESSAGE is required")
+
     creator = SimpleTextAndIcons()
 
     if args.preload:
         for filename in args.preload:
             creator.add_preload_img(filename)
 
-    msg_bitmaps = []
-    for msg_arg in args.message:
-        msg_bitmaps.append(creator.bitmap(msg_arg))
-
-    if creator.are_preloaded_unused():
-        print(
-            "\nWARNING:\n Your preloaded images are not used.\n Try without '-p' or embed the control character '^A' in your message.\n")
-
     if '12' in args.type or '12' in sys.argv[0]:
         print("Type: 12x48")
-        for msg_bitmap in msg_bitmaps:
-            # trivial hack to support 12x48 badges:
-            # patch extra empty lines into the message stream.
-            for i in reversed(range(1, int(len(msg_bitmap[0]) / 11) + 1)):
-                msg_bitmap[0][i * 11:i * 11] = array('B', [0])
+        lines = 12
     else:
         print("Type: 11x44")
+        lines = 11
 
-    lengths = [b[1] for b in msg_bitmaps]
     speeds = split_to_ints(args.speed)
     modes = split_to_ints(args.mode)
     blinks = split_to_ints(args.blink)
     ants = split_to_ints(args.ants)
     brightness = int(args.brightness)
+    # Exported and stored payloads must not depend on the time of rendering, see PayloadStore.
+    date = None if args.export or args.store else datetime.now()
+
+    if args.pipeline and not (args.export or args.store):
+        try:
+            lengths = creator.bitmap_lengths(args.message)
+        except (KeyError, IndexError) as e:
+            sys.exit(e.args[0])
+
+        def render():
+            for (msg_arg, length) in zip(args.message, lengths):
+                msg_bitmap = creator.bitmap(msg_arg)
+                if msg_bitmap[1] != length:
+                    raise ValueError("%s: rendered %d byte-columns, expected %d" % (msg_arg, msg_bitmap[1], length))
+                if lines == 12:
+                    patch_12x48(msg_bitmap)
+                yield msg_bitmap[0]
+
+        header = LedNameBadge.header(lengths, speeds, modes, blinks, ants, brightness, date)
+        write_or_exit(LedNameBadge.write_pipelined, header, render(), device=args.device, lines=lines)
+        warn_preloaded_unused(creator)
+        return
+
+    msg_bitmaps = []
+    try:
+        for msg_arg in args.message:
+            msg_bitmaps.append(creator.bitmap(msg_arg))
+    except (KeyError, IndexError) as e:
+        # unknown icon or image number
+        sys.exit(e.args[0])
+
+    warn_preloaded_unused(creator)
+
+    if lines == 12:
+        for msg_bitmap in msg_bitmaps:
+            patch_12x48(msg_bitmap)
+
+    lengths = [b[1] for b in msg_bitmaps]
 
     buf = array('B')
-    buf.extend(LedNameBadge.header(lengths, speeds, modes, blinks, ants, brightness))
+    buf.extend(LedNameBadge.header(lengths, speeds, modes, blinks, ants, brightness, date))
 
     for msg_bitmap in msg_bitmaps:
         buf.extend(msg_bitmap[0])
 
-    if not LedNameBadge._have_pyhidapi:
-        if args.hid != "0":
-            sys.exit("HID API access is needed but not initialized. Fix your setup")
-
-    LedNameBadge.write(buf)
+    if args.export or args.store:
+        try:
+            if args.export:
+                LedNameBadge.export(buf, args.export)
+                print("Payload written to %s" % args.export)
+            if args.store:
+                print("Payload stored as %s" % PayloadStore(args.store).put(buf))
+        except ValueError as e:
+            sys.exit(str(e))
+        return
+
+    write_or_exit(LedNameBadge.write, buf, device=args.device)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from lednamebadge import LruCache as testee
+
+
+class Test(TestCase):
+    def test_get(self):
+        created = []
+        cache = testee(2)
+
+        def create(key):
+            created.append(key)
+            return key * 2
+
+        self.assertEqual('aa', cache.get('a', create))
+        self.assertEqual('aa', cache.get('a', create))
+        self.assertEqual(['a'], created)
+
+    def test_least_recently_used(self):
+        created = []
+        cache = testee(2)
+        for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+            cache.get(key, lambda k: created.append(k) or k)
+        # 'b' was dropped for 'c', 'a' stayed, as it was used more recently
+        self.assertEqual(['a', 'b', 'c', 'b'], created)
+        self.assertEqual(2, len(cache))
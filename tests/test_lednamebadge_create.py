@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 from array import array
 from unittest import TestCase
 
@@ -32,3 +35,75 @@ class Test(TestCase):
                                 [128, 64, 32, 16, 8, 4, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 128, 64, 32, 0, 1, 2, 3,
                                  4, 5, 15, 31, 63, 127, 255]),
                           3), buf)
+
+    def test_bitmap_length(self):
+        creator = testee()
+        self.assertEqual(3, creator.bitmap_length("resources/bitpatterns.png"))
+        self.assertEqual(4, creator.bitmap_length("/:HEART2:\\"))
+        self.assertEqual(8, creator.bitmap_length("a:resources/bitpatterns.png:b:1:"))
+        self.assertEqual(creator.bitmap("a:resources/bitpatterns.png:b:1:::")[1],
+                         creator.bitmap_length("a:resources/bitpatterns.png:b:1:::"))
+
+    def test_parse_text(self):
+        self.assertEqual((('text', 'I'), ('icon', 'HEART2'), ('text', 'a:b'), ('image', 'gfx/x.png'), ('ref', 1),
+                          ('icon', 'HEART'), ('ref', 2)),
+                         testee.parse_text("I:HEART2:a::b:gfx/x.png::1:\x1a\x02"))
+        self.assertIs(testee.parse_text("cached :happy:"), testee.parse_text("cached :happy:"))
+        with self.assertRaises(KeyError):
+            testee.parse_text(":nosuchicon:")
+
+    def test_many_images(self):
+        creator = testee()
+        with tempfile.TemporaryDirectory() as d:
+            text = ""
+            for i in range(40):
+                shutil.copy("resources/bitpatterns.png", os.path.join(d, "%d.png" % i))
+                text += ":%s:" % os.path.join(d, "%d.png" % i)
+            buf = creator.bitmap(text + ":26::40:")
+        self.assertEqual(41, len(creator.bitmap_preloaded))
+        self.assertEqual(42 * 3, buf[1])
+        self.assertEqual(creator.bitmap("resources/bitpatterns.png")[0] * 42, buf[0])
+
+    def test_image_loaded_once(self):
+        creator = testee()
+        for i in range(100):
+            buf = creator.bitmap("a:resources/bitpatterns.png:b:resources/bitpatterns.png::1:")
+        self.assertEqual(2, len(creator.bitmap_preloaded))
+        self.assertEqual(11, buf[1])
+        self.assertEqual(11, creator.bitmap_length("a:resources/bitpatterns.png:b:resources/bitpatterns.png::1:"))
+
+    def test_bitmap_lengths_across_messages(self):
+        creator = testee()
+        messages = (":resources/bitpatterns.png:", "x:1:")
+        self.assertEqual([3, 4], creator.bitmap_lengths(messages))
+        self.assertEqual([3, 4], [creator.bitmap(m)[1] for m in messages])
+
+    def test_bitmap_img_length_height(self):
+        from PIL import Image
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "high.png")
+            Image.new('L', (8, 12)).save(filename)
+            with self.assertRaises(SystemExit):
+                testee.bitmap_img_length(filename)
+
+    def test_image_number_missing(self):
+        creator = testee()
+        text = ":resources/bitpatterns.png::resources/bitpatterns.png::2:"
+        with self.assertRaises(IndexError) as cm:
+            creator.bitmap(text)
+        self.assertIn("only 1 are loaded", str(cm.exception))
+        with self.assertRaises(IndexError):
+            testee().bitmap_length(text)
+
+    def test_image_modified(self):
+        from PIL import Image
+        creator = testee()
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "img.png")
+            Image.new('L', (8, 11)).save(filename)
+            self.assertEqual((array('B', (0,) * 11), 1), creator.bitmap(":%s:" % filename))
+            Image.new('L', (16, 11), 255).save(filename)
+            os.utime(filename, (0, 0))
+            self.assertEqual(4, creator.bitmap_length(":1::%s:" % filename))
+            self.assertEqual((array('B', (255,) * 44), 4), creator.bitmap(":%s::1:" % filename))
+            self.assertEqual(2, len(creator.bitmap_preloaded))
@@ -0,0 +1,86 @@
+import threading
+from unittest import TestCase
+
+from lednamebadge import FrozenTextAndIcons as testee
+from lednamebadge import ImageContext, SimpleTextAndIcons
+
+
+class Test(TestCase):
+    texts = ("Hello :HEART2: World!",
+             "a:resources/bitpatterns.png:b:1:",
+             "::happy:: :happy: :bicycle: \x1a",
+             "resources/bitpatterns.png",
+             "0987654321 ÄÖÜ àéç")
+
+    def test_same_as_simple(self):
+        renderer = testee()
+        for text in Test.texts:
+            self.assertEqual(SimpleTextAndIcons().bitmap(text), renderer.bitmap(text))
+            self.assertEqual(SimpleTextAndIcons().bitmap_length(text), renderer.bitmap_length(text))
+
+    def test_context(self):
+        renderer = testee()
+        context = ImageContext()
+        context.add_preload_img("resources/bitpatterns.png")
+        self.assertTrue(context.are_preloaded_unused())
+        self.assertEqual(5, renderer.bitmap_length("x:1:x", context))
+        renderer.bitmap(":resources/bitpatterns.png:", context)
+        self.assertEqual(3, len(context.bitmap_preloaded))
+        self.assertEqual(8, renderer.bitmap("x:1:x:2:", context)[1])
+        self.assertFalse(context.are_preloaded_unused())
+        with self.assertRaises(IndexError):
+            renderer.bitmap(":1:")
+
+    def test_immutable(self):
+        renderer = testee()
+        with self.assertRaises(AttributeError):
+            renderer.font = ()
+        with self.assertRaises(AttributeError):
+            renderer.bitmap_preloaded = []
+        with self.assertRaises(TypeError):
+            renderer.bitmap_named['heart'] = renderer.bitmap_named['HEART']
+        with self.assertRaises(TypeError):
+            renderer.char_offsets['A'] = 11
+
+    def test_threads(self):
+        renderer = testee()
+        expected = [renderer.bitmap(text) for text in Test.texts]
+        results = []
+        errors = []
+
+        def render(n):
+            try:
+                for i in range(20):
+                    context = ImageContext()
+                    for j in range(len(Test.texts)):
+                        text = Test.texts[(n + i + j) % len(Test.texts)]
+                        results.append((text, renderer.bitmap(text, context)))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=render, args=(n,)) for n in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertEqual(16 * 20 * len(Test.texts), len(results))
+        for (text, bitmap) in results:
+            self.assertEqual(expected[Test.texts.index(text)], bitmap)
+            self.assertEqual(expected[Test.texts.index(text)][0].tobytes(), bitmap[0].tobytes())
+
+    def test_class_dicts_changed(self):
+        expected = SimpleTextAndIcons().bitmap(":happy:x\x1d:ball:")
+        renderer = testee()
+        happy = SimpleTextAndIcons.bitmap_named.pop('happy')
+        name = SimpleTextAndIcons.builtin_names.pop('\x1d')
+        ball = SimpleTextAndIcons.bitmap_named['ball']
+        SimpleTextAndIcons.bitmap_named['ball'] = (happy[0], 1, '\x1e')
+        try:
+            self.assertEqual(expected, renderer.bitmap(":happy:x\x1d:ball:"))
+            with self.assertRaises(KeyError):
+                SimpleTextAndIcons().bitmap(":happy: was removed")
+        finally:
+            SimpleTextAndIcons.bitmap_named['happy'] = happy
+            SimpleTextAndIcons.builtin_names['\x1d'] = name
+            SimpleTextAndIcons.bitmap_named['ball'] = ball
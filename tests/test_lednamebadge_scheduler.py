@@ -0,0 +1,97 @@
+from array import array
+from unittest import TestCase
+from unittest.mock import patch
+
+from lednamebadge import PlaylistScheduler as testee
+from lednamebadge import DeviceError, LedNameBadge, SimulatedClock, WriteError
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(1000)
+        self.written = []
+
+    def payload(self, tag):
+        return array('B', (tag,) * 64)
+
+    def writer(self, name):
+        return lambda buf: self.written.append((self.clock.time(), name, buf[0]))
+
+    def test_rotate(self):
+        scheduler = testee({'a': self.writer('a')}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        scheduler.add(self.payload(2))
+        scheduler.run(1040)
+        self.assertEqual([(1000, 'a', 1), (1010, 'a', 2), (1020, 'a', 1), (1030, 'a', 2)], self.written)
+        self.assertEqual(1030, self.clock.time())
+
+    def test_priority_window(self):
+        scheduler = testee({'a': self.writer('a')}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        scheduler.add(self.payload(2), 1015, 1035, priority=1)
+        scheduler.run(1050)
+        # 1 is not written again at 1010, as it is shown already. 2 is shown exactly within its window.
+        self.assertEqual([(1000, 'a', 1), (1015, 'a', 2), (1035, 'a', 1)], self.written)
+
+    def test_badges(self):
+        scheduler = testee({'a': self.writer('a'), 'b': self.writer('b')}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        scheduler.add(self.payload(2), badges=('b',), priority=1)
+        scheduler.run(1010)
+        self.assertEqual([(1000, 'a', 1), (1000, 'b', 2)], self.written)
+
+    def test_ends(self):
+        scheduler = testee({'a': self.writer('a')}, 10, self.clock, self.payload(9))
+        entry = scheduler.add(array('B', (1,) * 20), 1005, 1025)
+        self.assertEqual(64, len(entry.payload))
+        scheduler.run()
+        self.assertEqual([(1000, 'a', 9), (1005, 'a', 1), (1025, 'a', 9)], self.written)
+        self.assertEqual(1030, self.clock.time())
+
+    def test_window_long_slot(self):
+        scheduler = testee({'a': self.writer('a')}, 300, SimulatedClock(3000))
+        self.clock = scheduler.clock
+        scheduler.add(self.payload(1))
+        scheduler.add(self.payload(2), 3601, 5401, priority=1)
+        scheduler.run(6000)
+        self.assertEqual([(3000, 'a', 1), (3601, 'a', 2), (5401, 'a', 1)], self.written)
+
+    def test_clear(self):
+        scheduler = testee({'a': self.writer('a')}, 10, self.clock)
+        scheduler.add(self.payload(1), end=1010)
+        scheduler.run()
+        self.assertEqual([(1000, 'a', 1), (1010, 'a', ord('w'))], self.written)
+        self.assertEqual(scheduler.default, scheduler.shown['a'])
+
+    def test_write_error(self):
+        failures = [WriteError(0, [], "USB glitch")]
+
+        def writer(buf):
+            if failures:
+                raise failures.pop()
+            self.written.append((self.clock.time(), 'a', buf[0]))
+
+        scheduler = testee({'a': writer}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        scheduler.run(1020)
+        self.assertEqual([(1010, 'a', 1)], self.written)
+
+    def test_device_error(self):
+        failures = [DeviceError("No led tag found"), RuntimeError("unexpected")]
+
+        def writer(buf):
+            if failures:
+                raise failures.pop()
+            self.written.append((self.clock.time(), 'a', buf[0]))
+
+        scheduler = testee({'a': writer}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        scheduler.run(1030)
+        self.assertEqual([(1020, 'a', 1)], self.written)
+
+    def test_device_ids(self):
+        scheduler = testee({'a': '1:5', 'b': '2:7'}, 10, self.clock)
+        scheduler.add(self.payload(1))
+        with patch.object(LedNameBadge, 'write') as write:
+            scheduler.run(1010)
+        self.assertEqual(['1:5', '2:7'], [c[1]['device'] for c in write.call_args_list])
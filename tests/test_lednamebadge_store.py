@@ -0,0 +1,63 @@
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from unittest import TestCase
+
+from lednamebadge import LedNameBadge
+from lednamebadge import PayloadStore as testee
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.buf = array('B', LedNameBadge.header((1,), (4,), (4,), (0,), (0,), 100,
+                                                  datetime.datetime(2022, 11, 13, 17, 38, 24)))
+        self.buf.extend((0xff,) * 11)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_put_get(self):
+        store = testee(os.path.join(self.dir.name, "store"))
+        key = store.put(self.buf)
+        self.assertEqual(64, len(key))
+        self.assertTrue(key in store)
+        self.assertEqual(75, len(self.buf))
+        self.assertEqual(self.buf.tolist() + [0] * 53, store.get(key).tolist())
+        self.assertEqual(key, testee.key(store.get(key)))
+
+    def test_put_twice(self):
+        store = testee(self.dir.name)
+        key = store.put(self.buf)
+        self.assertEqual(key, store.put(array('B', self.buf)))
+        self.assertEqual([key + '.badge'], os.listdir(self.dir.name))
+
+    def test_get_unknown(self):
+        store = testee(self.dir.name)
+        self.assertFalse('0' * 64 in store)
+        with self.assertRaises(KeyError):
+            store.get('0' * 64)
+
+    def test_get_damaged(self):
+        store = testee(self.dir.name)
+        key = store.put(self.buf)
+        with open(store.path(key), 'r+b') as f:
+            f.seek(70)
+            f.write(b'\0')
+        with self.assertRaises(ValueError):
+            store.get(key)
+
+    def test_store_deterministic(self):
+        keys = []
+        for i in range(2):
+            if i:
+                time.sleep(1.1)
+            output = subprocess.check_output([sys.executable, os.path.join("..", "lednamebadge.py"),
+                                              "--store", self.dir.name, "Hello"])
+            keys.append(output.decode().split()[-1])
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual([keys[0] + '.badge'], os.listdir(self.dir.name))
@@ -1,7 +1,14 @@
 import datetime
+import os
+import sys
+import tempfile
+from array import array
+from types import SimpleNamespace
 from unittest import TestCase
+from unittest.mock import patch
 
 from lednamebadge import LedNameBadge as testee
+from lednamebadge import DeviceError, WriteError
 
 
 class Test(TestCase):
@@ -72,8 +79,186 @@ class Test(TestCase):
         self.assertEqual(buf1[38 + 6:], buf2[38 + 6:])
         self.assertNotEqual(buf1[38:38 + 6], buf2[38:38 + 6])
 
+    def test_header_no_date(self):
+        buf = testee.header((6,), (4,), (4,), (0,), (0,), 100, None)
+        self.assertEqual([0] * 6, buf[38:38 + 6])
+
     def test_header_type(self):
         with self.assertRaises(TypeError):
             testee.header(("nan",), (4,), (4,), (0,), (0,), 80, self.test_date)
         with self.assertRaises(ValueError):
             testee.header((370,380), (4,), (4,), (0,), (0,), 80, self.test_date)
+
+    def test_write_reports(self):
+        buf = array('B', range(128))
+        sent = []
+        sendbuf = array('B', (0,) * 65)
+        stats = testee._write_reports(buf, sendbuf, lambda b: sent.append(b.tolist()) or len(b))
+        self.assertEqual([[0] + list(range(64)), [0] + list(range(64, 128))], sent)
+        self.assertEqual([1, 1], [s[0] for s in stats])
+
+    def test_write_reports_retry(self):
+        buf = array('B', range(192))
+        sent = []
+        results = [64, 10, -1, 64, 64]
+
+        def send(b):
+            sent.append(b[0])
+            return results.pop(0)
+
+        stats = testee._write_reports(buf, array('B', (0,) * 64), send, backoff=0)
+        self.assertEqual([0, 64, 64, 64, 128], sent)
+        self.assertEqual([1, 3, 1], [s[0] for s in stats])
+
+    def test_write_reports_resume(self):
+        buf = array('B', range(192))
+        sent = []
+
+        def failing(b):
+            if b[0] == 64:
+                raise IOError("USB glitch")
+            sent.append(b[0])
+            return len(b)
+
+        with self.assertRaises(WriteError) as cm:
+            testee._write_reports(buf, array('B', (0,) * 64), failing, retries=2, backoff=0)
+        self.assertEqual(1, cm.exception.report)
+        self.assertEqual(1, len(cm.exception.stats))
+        self.assertEqual([0], sent)
+        testee._write_reports(buf, array('B', (0,) * 64), lambda b: sent.append(b[0]) or len(b),
+                              start=cm.exception.report)
+        self.assertEqual([0, 64, 128], sent)
+
+    def test_export_load(self):
+        buf = array('B', testee.header((2,), (4,), (4,), (0,), (0,), 100, self.test_date))
+        buf.extend(range(22))
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "out.badge")
+            testee.export(buf, filename)
+            self.assertEqual(128, os.path.getsize(filename))
+            loaded = testee.load(filename)
+        self.assertEqual(86, len(buf))
+        self.assertEqual(buf.tolist() + [0] * 42, loaded.tolist())
+
+    def test_export_too_long(self):
+        with tempfile.TemporaryDirectory() as d:
+            with self.assertRaises(ValueError):
+                testee.export(array('B', (0,) * 8193), os.path.join(d, "out.badge"))
+
+    def test_load_invalid(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "out.badge")
+            with open(filename, 'wb') as f:
+                f.write(b'\0' * 64)
+            with self.assertRaises(ValueError):
+                testee.load(filename)
+
+    def test_write_pipelined(self):
+        sent = []
+        sendbuf = array('B', (0,) * 65)
+        device = (sendbuf, lambda b: sent.append(b.tolist()) or len(b), 0, lambda: None)
+        header = testee.header((2, 5), (4,), (4,), (0,), (0,), 100, self.test_date)
+        bitmaps = [array('B', range(22)), array('B', range(100, 155))]
+        with patch.object(testee, '_open', return_value=device):
+            stats = testee.write_pipelined(header, iter(bitmaps))
+        expected = array('B', header)
+        for b in bitmaps:
+            expected.extend(b)
+        expected.extend((0,) * (192 - len(expected)))
+        self.assertEqual(3, len(stats))
+        self.assertEqual([[0] + expected[i:i + 64].tolist() for i in range(0, 192, 64)], sent)
+
+    def test_write_pipelined_render_error(self):
+        def render():
+            yield array('B', (0,) * 11)
+            raise ValueError("rendering failed")
+
+        device = (array('B', (0,) * 64), len, 0, lambda: None)
+        header = testee.header((1, 1), (4,), (4,), (0,), (0,), 100, self.test_date)
+        with patch.object(testee, '_open', return_value=device):
+            with self.assertRaises(ValueError):
+                testee.write_pipelined(header, render())
+
+    def test_write_pipelined_exit(self):
+        def render():
+            yield array('B', (0,) * 11)
+            sys.exit("image height must be 11px")
+
+        device = (array('B', (0,) * 64), len, 0, lambda: None)
+        header = testee.header((1, 1), (4,), (4,), (0,), (0,), 100, self.test_date)
+        with patch.object(testee, '_open', return_value=device):
+            with self.assertRaises(SystemExit):
+                testee.write_pipelined(header, render())
+
+    def test_open_device(self):
+        class FakeDevice:
+            def __init__(self, bus, address):
+                self.bus = bus
+                self.address = address
+                self.manufacturer = 'LSicroelectronics'
+                self.product = 'LS32 Custm HID'
+
+            def is_kernel_driver_active(self, interface):
+                return False
+
+            def set_configuration(self):
+                pass
+
+        fakes = [FakeDevice(1, 5), FakeDevice(2, 7)]
+
+        def find(find_all=False, custom_match=None, **kwargs):
+            found = [d for d in fakes if custom_match is None or custom_match(d)]
+            return found if find_all else (found[0] if found else None)
+
+        # LedNameBadge.usb only exists, if pyhidapi is not installed
+        usb = SimpleNamespace(core=SimpleNamespace(find=find))
+        with patch.object(testee, '_have_pyhidapi', False), patch.object(testee, 'usb', usb, create=True):
+            self.assertEqual(['1:5', '2:7'], testee.devices())
+            sent = []
+            fakes[1].write = lambda endpoint, b: sent.append(b[0]) or len(b)
+            (sendbuf, send, delay, close) = testee._open('2:7')
+            self.assertEqual(64, send(array('B', (7,) * 64)))
+            self.assertEqual([7], sent)
+            with self.assertRaises(DeviceError):
+                testee._open('3:1')
+            fakes[:] = []
+            with self.assertRaises(DeviceError):
+                testee._open()
+
+    def test_write_pipelined_too_long(self):
+        opened = []
+        header = testee.header((340, 340), (4,), (4,), (0,), (0,), 100, self.test_date)
+        with patch.object(testee, '_open', side_effect=lambda device: opened.append(device)):
+            bitmaps = iter([array('B', (0,) * 340 * 11)] * 2)
+            with self.assertRaises(ValueError):
+                testee.write_pipelined(header, bitmaps, lines=12)
+        self.assertEqual([], opened)
+
+    def test_open_device_hid(self):
+        infos = [SimpleNamespace(path=b'/dev/hidraw1', manufacturer_string='LSicroelectronics',
+                                 product_string='LS32 Custm HID', interface_number=0, usage_page=65280),
+                 SimpleNamespace(path=b'/dev/hidraw2', manufacturer_string='LSicroelectronics',
+                                 product_string='LS32 Custm HID', interface_number=0, usage_page=65280)]
+        opened = []
+        sent = []
+        pyhidapi = SimpleNamespace(hid_enumerate=lambda vendor, product: list(infos),
+                                   hid_open_path=lambda path: opened.append(path) or path,
+                                   hid_write=lambda dev, b: sent.append((dev, b[0], b[1])) or len(b),
+                                   hid_close=lambda dev: opened.remove(dev))
+        with patch.object(testee, '_have_pyhidapi', True), patch.object(testee, 'pyhidapi', pyhidapi, create=True):
+            self.assertEqual(['/dev/hidraw1', '/dev/hidraw2'], testee.devices())
+            (sendbuf, send, delay, close) = testee._open('/dev/hidraw2')
+            self.assertEqual([b'/dev/hidraw2'], opened)
+            sendbuf[1] = 7
+            self.assertEqual(65, send(sendbuf))
+            self.assertEqual([(b'/dev/hidraw2', 0, 7)], sent)
+            close()
+            self.assertEqual([], opened)
+            with self.assertRaises(DeviceError):
+                testee._open('/dev/hidraw3')
+            pyhidapi.hid_open_path = lambda path: None
+            with self.assertRaises(DeviceError):
+                testee._open()
+            infos[:] = []
+            with self.assertRaises(DeviceError):
+                testee._open()